@@ -4,6 +4,7 @@ from datetime import datetime, timezone, timedelta
 import yaml
 
 from core import P2PNode
+from reliable import parse_reliable_config
 from signaling.baidupcs import BaiduPCSSignaling
 from tunnel import Tunnel
 
@@ -17,6 +18,7 @@ def main():
     node_id = config["id"]
     peer_id = config["peer"]
     port = config["port"]
+    reliable_control, reliable_ports = parse_reliable_config(config.get("reliable"))
 
     # 2️⃣ 创建信令客户端
     signaling = BaiduPCSSignaling()
@@ -91,7 +93,9 @@ def main():
     tunnel = Tunnel(
         mode=mode,
         endpoint=node,
-        port=port
+        port=port,
+        reliable_control=reliable_control,
+        reliable_ports=reliable_ports
     )
 
     tunnel.start()
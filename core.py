@@ -41,7 +41,7 @@ class P2PNode:
     def recv(self, handler, timeout=0.3):
         try:
             self.sock.settimeout(timeout)
-            data, addr = self.sock.recvfrom(4096)
+            data, addr = self.sock.recvfrom(65535)
         except socket.timeout:
             return
 
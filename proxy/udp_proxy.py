@@ -5,21 +5,38 @@ import selectors
 
 from core import P2PNode
 from proxy import Proxy
+from reliable import ReliableChannel, parse_reliable_control
 
 from concurrent.futures import ThreadPoolExecutor
 
 
 class UDPProxy(Proxy):
+    CONTROL_CHANNEL_ID = 0
+    DATA_CHANNEL_ID = 1
+    ORDERED_WITH_DATA = ("CONNECT", "CONNECT_ACK")
 
-    def __init__(self, mode: str, tunnel_endpoint: P2PNode, port: int = None):
+    def __init__(self, mode: str, tunnel_endpoint: P2PNode, port: int = None,
+                 reliable_control=None, reliable_data: bool = False):
         """
         mode: "client" or "server"
         client 模式需要 bind local_port
         server 模式不 bind
+        reliable_control: 走可靠通道发送的控制消息类型, 如 {"CONNECT", "CONNECT_ACK", "DISCONNECT"}
+        reliable_data: 数据包是否走可靠通道
         """
         self.mode = mode
         self.tunnel_endpoint = tunnel_endpoint
         self.port = port
+        self.reliable_control = parse_reliable_control(reliable_control)
+        self.reliable_data = reliable_data
+        # 接收方向总是能处理可靠帧, 发送方向按配置选择
+        # 控制消息和数据各用一个通道, 数据丢包或排队不会阻塞控制消息
+        self.control_channel = ReliableChannel(tunnel_endpoint, channel_id=self.CONTROL_CHANNEL_ID)
+        self.data_channel = ReliableChannel(tunnel_endpoint, channel_id=self.DATA_CHANNEL_ID)
+        self.channels = {
+            self.CONTROL_CHANNEL_ID: self.control_channel,
+            self.DATA_CHANNEL_ID: self.data_channel,
+        }
         self.client_socket_map = {}
         self.lock_socket = threading.Lock()
         self.addr_map = {}
@@ -59,7 +76,7 @@ class UDPProxy(Proxy):
     def _server_forward_socket_to_tunnel(self, client_id, data):
         # 前面加上 client_id
         client_id_byte = client_id.to_bytes(1, byteorder='big')
-        self.tunnel_endpoint.send_to_peer(client_id_byte + data)
+        self._send_data(client_id_byte + data)
 
     def client_forward_to_tunnel(self,timeout=0.05):
         try:
@@ -70,18 +87,54 @@ class UDPProxy(Proxy):
 
         exists, client_id = self._map_addr_from_packet(addr)
         if not exists:
-             payload = f"CONNECT {client_id}".encode()
-             self.tunnel_endpoint.send_to_peer(payload)
+             self._send_control("CONNECT", client_id)
 
         client_id_byte = client_id.to_bytes(1, byteorder='big')
         data = client_id_byte + data
-        self.tunnel_endpoint.send_to_peer(data)
+        self._send_data(data)
+
+    def _send_control(self, msg_type: str, client_id: int, repeat: int = 1):
+        """
+        可靠通道保证只交付一次, 只发一遍; 否则(或可靠通道队列满)按 repeat 次数盲发
+        数据走可靠通道时, CONNECT/CONNECT_ACK 也走数据通道, 保证对端先建好映射再收到数据,
+        否则数据先到会被丢掉, 而数据通道已经 ACK 过不会再重传
+        """
+        payload = f"{msg_type} {client_id}".encode()
+        if self.reliable_data and msg_type in self.ORDERED_WITH_DATA:
+            channel = self.data_channel
+        elif msg_type in self.reliable_control:
+            channel = self.control_channel
+        else:
+            channel = None
+        if channel is not None and channel.send(payload):
+            return
+        for i in range(repeat):
+            self.tunnel_endpoint.send_to_peer(payload)
+
+    def _send_data(self, data: bytes):
+        if self.reliable_data:
+            self.data_channel.send(data)
+        else:
+            self.tunnel_endpoint.send_to_peer(data)
+
+    def _dispatch_reliable(self, data, addr, handler):
+        channel = self.channels.get(ReliableChannel.frame_channel_id(data))
+        if channel is None:
+            print("[reliable] unknown channel, drop packet")
+            return
+        for payload in channel.on_receive(data):
+            try:
+                handler(payload, addr)
+            except Exception as e:
+                print(f"[reliable] handle payload error: {e}")
 
     def _client_tunnel_endpoint_recv_handler(self, data, addr):
-        if data.startswith(b'CONNECT_ACK'):
+        if ReliableChannel.is_frame(data):
+            self._dispatch_reliable(data, addr, self._client_tunnel_endpoint_recv_handler)
+        elif data.startswith(b'CONNECT_ACK'):
             text = data.decode(errors='ignore').strip()
             client_id = int(text.split()[1])
-            client_addr_time = self.pending_client_id_map.pop(client_id)
+            client_addr_time = self.pending_client_id_map.pop(client_id, None)
             if client_addr_time is not None:
                 with self.lock_client:
                     self.client_id_map[client_id] = (client_addr_time[0], time.time())
@@ -102,7 +155,9 @@ class UDPProxy(Proxy):
             return
 
     def _server_tunnel_endpoint_recv_handler(self, data, addr):
-        if data.startswith(b'CONNECT'):
+        if ReliableChannel.is_frame(data):
+            self._dispatch_reliable(data, addr, self._server_tunnel_endpoint_recv_handler)
+        elif data.startswith(b'CONNECT'):
             text = data.decode(errors='ignore').strip()
             client_id = int(text.split()[1])
             with self.lock_socket:
@@ -113,7 +168,7 @@ class UDPProxy(Proxy):
                     self.client_socket_map[client_id] = (sock,time.time())
                     self.selector.register(sock, selectors.EVENT_READ, data=(client_id, sock))
                 # 回复客户端 ACK
-                self.tunnel_endpoint.send_to_peer(f"CONNECT_ACK {client_id}".encode())
+                self._send_control("CONNECT_ACK", client_id)
 
         elif data.startswith(b'DISCONNECT'):
             text = data.decode(errors='ignore').strip()
@@ -163,8 +218,7 @@ class UDPProxy(Proxy):
                 for cid in to_remove:
                     del self.pending_client_id_map[cid]
                     #通知对端把socket关掉
-                    for i in range(5):
-                        self.tunnel_endpoint.send_to_peer(f"DISCONNECT {cid}".encode())
+                    self._send_control("DISCONNECT", cid, repeat=5)
                     # 遍历 addr_map 找到对应的 key 并删除
                     with self.lock_addr:
                         for addr_key, stored_cid in list(self.addr_map.items()):
@@ -178,8 +232,7 @@ class UDPProxy(Proxy):
                 for cid in to_remove:
                     del self.client_id_map[cid]
                     #通知对端把socket关掉
-                    for i in range(5):
-                        self.tunnel_endpoint.send_to_peer(f"DISCONNECT {cid}".encode())
+                    self._send_control("DISCONNECT", cid, repeat=5)
                     # 遍历 addr_map 找到对应的 key 并删除
                     with self.lock_addr:
                         for addr_key, stored_cid in list(self.addr_map.items()):
@@ -0,0 +1,277 @@
+import struct
+import threading
+import time
+from collections import deque
+
+from core import P2PNode
+
+RELIABLE_CONTROL_TYPES = ("CONNECT", "CONNECT_ACK", "DISCONNECT")
+
+
+def _as_list(value) -> list:
+    # 配置里单个值和列表都允许, 如 control: CONNECT 或 ports: 27000
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def parse_reliable_control(value) -> set:
+    """
+    规范化 reliable.control 配置, 大小写不敏感, 未知类型直接报错
+    """
+    types = {str(t).strip().upper() for t in _as_list(value)}
+    unknown = types - set(RELIABLE_CONTROL_TYPES)
+    if unknown:
+        raise ValueError(f"unknown reliable control type: {sorted(unknown)}, "
+                         f"supported: {list(RELIABLE_CONTROL_TYPES)}")
+    return types
+
+
+def parse_reliable_ports(value) -> set:
+    """
+    规范化 reliable.ports 配置, 端口必须是整数
+    """
+    ports = set()
+    for p in _as_list(value):
+        try:
+            ports.add(int(p))
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid reliable port: {p!r}")
+    return ports
+
+
+def parse_reliable_config(value) -> (set, set):
+    """
+    校验整个 reliable 配置段, 返回 (control, ports), 启动时就调用, 写错不用等到打洞之后才发现
+    """
+    if value is None:
+        return set(), set()
+    if not isinstance(value, dict):
+        raise ValueError(f"reliable config must be a mapping, got: {value!r}")
+    unknown = set(value) - {"control", "ports"}
+    if unknown:
+        raise ValueError(f"unknown reliable config key: {sorted(unknown)}")
+    return parse_reliable_control(value.get("control")), parse_reliable_ports(value.get("ports"))
+
+
+class ReliableChannel:
+    """
+    P2PNode 之上的轻量可靠有序通道
+    序号 + 选择确认(SACK) + 基于 RTT 的重传超时(RTO) + 小型重排序缓冲区
+    DATA 帧: 0x00 | channel_id(1B) | 'D' | seq(4B) | base(4B) | payload
+    ACK  帧: 0x00 | channel_id(1B) | 'A' | 累计确认号(4B) | sack 个数(1B) | sack 序号(4B)...
+    首字节 0x00 不会是 client_id(从 2 开始分配), 不会和普通数据包混淆
+    base 是发送端最小的未确认序号, 发送端放弃重传的包由接收端据此跳过, 不会一直卡住
+    本地序号是不回绕的整数, 线上只带低 32 位, 收到后按序列号算术(RFC 1982)还原
+    一个隧道上可以有多个通道, 各自独立的序号空间和窗口, 按 channel_id 区分
+    """
+    MARKER = b'\x00'
+    DATA_TYPE = b'D'
+    ACK_TYPE = b'A'
+    MAX_SACKS = 32
+    SEQ_MASK = 0xFFFFFFFF
+
+    def __init__(self, endpoint: P2PNode, channel_id: int = 0, window: int = 64, max_queue: int = 1024,
+                 min_rto: float = 0.2, max_rto: float = 3.0, max_retries: int = 10):
+        self.endpoint = endpoint
+        self.channel_id = channel_id
+        self.DATA_PREFIX = self.MARKER + channel_id.to_bytes(1, byteorder='big') + self.DATA_TYPE
+        self.ACK_PREFIX = self.MARKER + channel_id.to_bytes(1, byteorder='big') + self.ACK_TYPE
+        self.window = window
+        self.max_queue = max_queue
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.max_retries = max_retries
+
+        # 发送端状态
+        self.send_seq = 0
+        self.send_queue = deque()
+        self.unacked = {}  # seq -> [payload, sent_ts, retries, sack_hits, rto]
+        self.lock_send = threading.Lock()
+        self.srtt = None
+        self.rttvar = None
+        self.rto = 1.0
+
+        # 接收端状态
+        self.recv_next = 0
+        self.reorder_buffer = {}
+        self.lock_recv = threading.Lock()
+
+        # 重传线程在第一次 send 时才启动, 只收不发的通道不需要
+        self.retransmit_started = False
+
+    @classmethod
+    def is_frame(cls, data: bytes) -> bool:
+        return data.startswith(cls.MARKER)
+
+    @staticmethod
+    def frame_channel_id(data: bytes):
+        return data[1] if len(data) > 1 else None
+
+    @classmethod
+    def _unwrap(cls, wire_seq: int, ref: int) -> int:
+        # 以 ref 为参考, 把 32 位线上序号还原为离 ref 最近的本地序号
+        diff = (wire_seq - ref) & cls.SEQ_MASK
+        if diff > cls.SEQ_MASK // 2:
+            diff -= cls.SEQ_MASK + 1
+        return ref + diff
+
+    def send(self, payload: bytes) -> bool:
+        """
+        不阻塞: 窗口满时先排队, 收到 ACK 腾出窗口后再发出
+        """
+        with self.lock_send:
+            if not self.retransmit_started:
+                self.retransmit_started = True
+                threading.Thread(target=self._retransmit_loop, daemon=True).start()
+            if len(self.send_queue) >= self.max_queue:
+                print("[reliable] send queue full, drop packet")
+                return False
+            self.send_queue.append(payload)
+            to_send = self._flush()
+
+        self._send_frames(to_send)
+        return True
+
+    def on_receive(self, data: bytes) -> list:
+        """
+        处理对端发来的可靠帧, 返回按序交付的 payload 列表(ACK 帧返回空列表)
+        """
+        if data.startswith(self.DATA_PREFIX):
+            return self._handle_data(data)
+        if data.startswith(self.ACK_PREFIX):
+            self._handle_ack(data)
+        return []
+
+    def _frame(self, seq, payload):
+        # 调用方需持有 lock_send; base 在每次(重)发时重新计算
+        base = min(self.unacked) if self.unacked else self.send_seq
+        return self.DATA_PREFIX + struct.pack('!II', seq & self.SEQ_MASK, base & self.SEQ_MASK) + payload
+
+    def _send_frames(self, frames):
+        for frame in frames:
+            try:
+                self.endpoint.send_to_peer(frame)
+            except Exception as e:
+                print(f"[reliable] send error: {e}")
+
+    def _flush(self):
+        # 调用方需持有 lock_send; 序号在真正发出时才分配, 队列里丢弃的包不会让对端卡住
+        to_send = []
+        now = time.time()
+        while self.send_queue:
+            lowest = min(self.unacked) if self.unacked else self.send_seq
+            if self.send_seq >= lowest + self.window:
+                break
+            payload = self.send_queue.popleft()
+            seq = self.send_seq
+            self.send_seq += 1
+            self.unacked[seq] = [payload, now, 0, 0, self.rto]
+            to_send.append(self._frame(seq, payload))
+        return to_send
+
+    def _handle_data(self, data: bytes) -> list:
+        header_len = len(self.DATA_PREFIX) + 8
+        if len(data) < header_len:
+            return []
+        wire_seq, wire_base = struct.unpack('!II', data[len(self.DATA_PREFIX):header_len])
+        payload = data[header_len:]
+
+        delivered = []
+        with self.lock_recv:
+            seq = self._unwrap(wire_seq, self.recv_next)
+            base = self._unwrap(wire_base, self.recv_next)
+            # 发送端已放弃 base 之前的包: 交付已缓存的, 跳过缺失的
+            if base > self.recv_next:
+                for s in sorted(s for s in self.reorder_buffer if s < base):
+                    delivered.append(self.reorder_buffer.pop(s))
+                self.recv_next = base
+            # 已交付或已缓存的重复包只回 ACK, 保证只交付一次
+            if self.recv_next <= seq < self.recv_next + self.window and seq not in self.reorder_buffer:
+                self.reorder_buffer[seq] = payload
+            while self.recv_next in self.reorder_buffer:
+                delivered.append(self.reorder_buffer.pop(self.recv_next))
+                self.recv_next += 1
+            sacks = sorted(self.reorder_buffer)[:self.MAX_SACKS]
+            ack = self.ACK_PREFIX + struct.pack('!IB', self.recv_next & self.SEQ_MASK, len(sacks))
+            ack += b''.join(struct.pack('!I', s & self.SEQ_MASK) for s in sacks)
+
+        # ACK 发送失败不能影响交付, 对端重传时会再次 ACK
+        self._send_frames([ack])
+        return delivered
+
+    def _handle_ack(self, data: bytes):
+        header_len = len(self.ACK_PREFIX) + 5
+        if len(data) < header_len:
+            return
+        wire_cum, count = struct.unpack('!IB', data[len(self.ACK_PREFIX):header_len])
+        wire_sacks = struct.unpack(f'!{count}I', data[header_len:header_len + count * 4])
+
+        resend = []
+        with self.lock_send:
+            now = time.time()
+            cum = self._unwrap(wire_cum, self.send_seq)
+            sacks = {self._unwrap(s, self.send_seq) for s in wire_sacks}
+            for seq in [s for s in self.unacked if s < cum or s in sacks]:
+                _, sent_ts, retries, _, _ = self.unacked.pop(seq)
+                # Karn 算法: 重传过的包不参与 RTT 采样
+                if retries == 0:
+                    self._update_rto(now - sent_ts)
+
+            # 快速重传: 后面的包已被 SACK 三次而自己仍未确认, 不等 RTO 直接重发
+            if sacks:
+                highest = max(sacks)
+                for seq, entry in self.unacked.items():
+                    if seq < highest:
+                        entry[3] += 1
+                        if entry[3] == 3:
+                            entry[1] = now
+                            entry[2] += 1
+                            resend.append(self._frame(seq, entry[0]))
+
+            resend.extend(self._flush())
+
+        self._send_frames(resend)
+
+    def _update_rto(self, rtt: float):
+        # RFC 6298
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + max(0.01, 4 * self.rttvar)))
+
+    def _retransmit(self):
+        resend = []
+        with self.lock_send:
+            now = time.time()
+            for seq in list(self.unacked):
+                entry = self.unacked[seq]
+                if now - entry[1] < entry[4]:
+                    continue
+                # 对端长时间不可达: 放弃该包, 腾出窗口, 对端根据 base 跳过
+                if entry[2] >= self.max_retries:
+                    del self.unacked[seq]
+                    print(f"[reliable] give up seq={seq} after {entry[2]} retries")
+                    continue
+                entry[1] = now
+                entry[2] += 1
+                entry[3] = 0
+                # 每个包独立的 RTO, 指数退避到 max_rto 为止
+                entry[4] = min(self.max_rto, entry[4] * 2)
+                resend.append(self._frame(seq, entry[0]))
+            resend.extend(self._flush())
+
+        self._send_frames(resend)
+
+    def _retransmit_loop(self):
+        while True:
+            try:
+                self._retransmit()
+            except Exception as e:
+                print(f"[reliable] retransmit error: {e}")
+            time.sleep(0.02)
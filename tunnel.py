@@ -3,12 +3,17 @@ import time
 
 from core import P2PNode
 from proxy.udp_proxy import UDPProxy
+from reliable import parse_reliable_ports
 
 class Tunnel:
-    def __init__(self, mode: str, endpoint: P2PNode, port: int):
+    def __init__(self, mode: str, endpoint: P2PNode, port: int,
+                 reliable_control=None, reliable_ports=None):
         self.mode = mode
         self.endpoint = endpoint
-        self.proxy = UDPProxy(mode=mode, tunnel_endpoint=endpoint, port=port)
+        # 映射端口在 reliable_ports 中时, 该端口的数据包走可靠通道
+        reliable_data = port in parse_reliable_ports(reliable_ports)
+        self.proxy = UDPProxy(mode=mode, tunnel_endpoint=endpoint, port=port,
+                              reliable_control=reliable_control, reliable_data=reliable_data)
     def start(self):
         if self.mode == "client":
             self._client_loop()